@@ -1,9 +1,11 @@
 import argparse
-import builtins
 import codecs
 import contextlib
 import difflib
+import functools
 import glob
+import io
+import itertools
 import locale
 import os
 import re
@@ -11,6 +13,7 @@ import sys
 import textwrap
 import typing as t
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 try:
@@ -25,13 +28,41 @@ _cjk_closing_punct = (
     r"\u3001\u3002\uff0c\uff1f\uff01\uff1a\uff1b\u201d\u2019]"
 )
 
+# Classify a line in an entry and extract the quoted message with one match
+_ENTRY_LINE_RE = re.compile(
+    "(?P<comment>#)|msgid.{msgid}|msgstr.{msgstr}|{message}".format(
+        **{
+            name: MESSAGE_RE.replace("(.*)", f"(?P<{name}>.*)", 1)
+            for name in ("msgid", "msgstr", "message")
+        }
+    )
+)
+_SUPPLEMENTARY_RE = re.compile("[\U00010000-\U0010ffff]")
+_ESCAPE_RE = re.compile(r'(?<!\\)"')
+_CJK_WORDSEP_RE = re.compile(
+    textwrap.TextWrapper.wordsep_re.pattern.rstrip(") \n")
+    + r")|(?<=%s) (?=\w)|(?=%s)))" % (_cjk_closing_punct, _cjk_opening_punct),
+    re.VERBOSE,
+)
+
 
 class ParseError(Exception):
     pass
 
 
 def escape_quotes(text: str) -> str:
-    return re.sub(r'(?<!\\)"', '\\"', text)
+    if "\\" not in text:
+        # Nothing can be escaped already, skip the lookbehind regex
+        return text.replace('"', '\\"')
+    return _ESCAPE_RE.sub('\\"', text)
+
+
+@functools.lru_cache(maxsize=None)
+def _full_width_chars() -> t.FrozenSet[str]:
+    """All full-width BMP characters, built on first use."""
+    return frozenset(
+        c for c in map(chr, range(0x10000)) if unicodedata.east_asian_width(c) in "WAF"
+    )
 
 
 def is_full_width(text: str) -> bool:
@@ -39,7 +70,22 @@ def is_full_width(text: str) -> bool:
     return unicodedata.east_asian_width(text) in "WAF"
 
 
-def support_unicode():
+@functools.lru_cache(maxsize=None)
+def _full_width_weights(factor: float) -> t.Dict[str, float]:
+    """Map full-width BMP characters to the width factor, for looking up the widths in C."""
+    return dict.fromkeys(_full_width_chars(), factor)
+
+
+def count_full_width(text: str) -> int:
+    """Return the number of full-width characters in the text."""
+    count = sum(map(_full_width_chars().__contains__, text))
+    if _SUPPLEMENTARY_RE.search(text):
+        count += sum(is_full_width(c) for c in text if c > "\uffff")
+    return count
+
+
+@functools.lru_cache(maxsize=1)
+def support_unicode() -> bool:
     """Check whether operating system supports main symbols or not."""
     encoding = sys.stdout.encoding
     if encoding is None:
@@ -52,20 +98,78 @@ def support_unicode():
     return encoding == "utf-8"
 
 
-@contextlib.contextmanager
-def len_with_cjk_width_factor(factor: float) -> t.Generator[None, None, None]:
-    builtin_len = builtins.len
-
-    def new_len(text: str) -> int:
-        if not isinstance(text, str):
-            return builtin_len(text)
-        return int(sum(factor if is_full_width(c) else 1 for c in text))
-
-    builtins.len = new_len
-    try:
-        yield
-    finally:
-        builtins.len = builtin_len
+class CJKTextWrapper(textwrap.TextWrapper):
+    """A text wrapper that measures full-width characters by a width factor
+    and allows line breaks around CJK punctuations.
+    """
+
+    wordsep_re = _CJK_WORDSEP_RE
+
+    def __init__(self, width: int, cjk_width_factor: float = 1.8, **kwargs: t.Any) -> None:
+        super().__init__(width, **kwargs)
+        if self.max_lines is not None:
+            raise ValueError("max_lines is not supported by CJKTextWrapper")
+        self.cjk_width_factor = cjk_width_factor
+
+    def measure(self, text: str) -> int:
+        if text.isascii():
+            return len(text)
+        factor = self.cjk_width_factor
+        # Add up the widths one by one, the float rounding of this sum decides where
+        # lines break, so it must stay the same to keep formatted files stable.
+        if _SUPPLEMENTARY_RE.search(text):
+            # Not covered by the lookup table, check each character instead
+            return int(sum(factor if is_full_width(c) else 1 for c in text))
+        return int(sum(map(_full_width_weights(factor).get, text, itertools.repeat(1))))
+
+    def _wrap_chunks(self, chunks: t.List[str]) -> t.List[str]:
+        # A single forward scan over the chunks with their widths measured once,
+        # producing the same lines as the stdlib implementation would with
+        # `len()` replaced by `measure()`. `max_lines` is rejected in `__init__()`.
+        if self.width <= 0:
+            raise ValueError(f"invalid width {self.width!r} (must be > 0)")
+        measure = self.measure
+        widths = [measure(chunk) for chunk in chunks]
+        lines: t.List[str] = []
+        i, count = 0, len(chunks)
+
+        while i < count:
+            indent = self.subsequent_indent if lines else self.initial_indent
+            width = self.width - measure(indent)
+
+            if self.drop_whitespace and lines and chunks[i].strip() == "":
+                i += 1
+
+            cur_line: t.List[str] = []
+            cur_len = 0
+            while i < count and cur_len + widths[i] <= width:
+                cur_line.append(chunks[i])
+                cur_len += widths[i]
+                i += 1
+
+            if i < count and widths[i] > width:
+                # The next chunk is too long to fit on any line
+                chunk = chunks[i]
+                if self.break_long_words:
+                    end = space_left = width - cur_len if width >= 1 else 1
+                    if self.break_on_hyphens:
+                        hyphen = chunk.rfind("-", 0, space_left)
+                        if hyphen > 0 and any(c != "-" for c in chunk[:hyphen]):
+                            end = hyphen + 1
+                    cur_line.append(chunk[:end])
+                    chunks[i] = chunk[end:]
+                    widths[i] = measure(chunks[i])
+                elif not cur_line:
+                    cur_line.append(chunk)
+                    i += 1
+
+            if self.drop_whitespace and cur_line and cur_line[-1].strip() == "":
+                del cur_line[-1]
+
+            if cur_line:
+                lines.append(indent + "".join(cur_line))
+
+        return lines
 
 
 class Span(t.NamedTuple):
@@ -87,114 +191,136 @@ class Entry:
         return text
 
     def _format_text(
-        self, title: str, lines: t.List[str], width: int, reformat: bool = True
+        self,
+        title: str,
+        lines: t.List[str],
+        width: int,
+        wrapper: CJKTextWrapper,
+        reformat: bool = True,
     ) -> t.List[str]:
         if not reformat:
             return [f'{title} "{lines[0]}"'] + [f'"{line}"' for line in lines[1:]]
 
+        if len(lines) == 1 and len(title) + len(lines[0]) + 3 <= width:
+            bare = lines[0]
+            if bare.isascii() and '"' not in bare:
+                # Already short and nothing for process_text() to change
+                return [f'{title} "{bare}"']
+
         text = self.process_text(lines)
-        if len(title) + len(text) + 3 <= width:
+        ascii_only = text.isascii()
+        text_width = len(text) if ascii_only else wrapper.measure(text)
+        if len(title) + text_width + 3 <= width:
             # 1 space + 2 quotes = 3
             return [f'{title} "{text}"']
 
-        wrapper = textwrap.TextWrapper(width - 2, drop_whitespace=False)
-        wrapper.wordsep_re = re.compile(
-            wrapper.wordsep_re.pattern.rstrip(") \n")
-            + r")|(?<=%s) (?=\w)|(?=%s)))" % (_cjk_closing_punct, _cjk_opening_punct),
-            re.VERBOSE,
-        )
+        if ascii_only:
+            # Neither full-width characters nor CJK punctuations, the stdlib wrapper is enough
+            wrap = textwrap.TextWrapper(width - 2, drop_whitespace=False).wrap
+        else:
+            wrap = wrapper.wrap
         if self.msgid == [""]:
             paras = [f"{para}\\n" for para in text.split("\\n")]
             paras[-1] = paras[-1][:-2]
-            return [f'{title} ""'] + [f'"{line}"' for para in paras for line in wrapper.wrap(para)]
-        return [f'{title} ""'] + [f'"{line}"' for line in wrapper.wrap(text)]
+            return [f'{title} ""'] + [f'"{line}"' for para in paras for line in wrap(para)]
+        return [f'{title} ""'] + [f'"{line}"' for line in wrap(text)]
 
     def format(
         self, width: int, cjk_width_factor: float = 1.8, no_msgid: bool = False
     ) -> t.List[str]:
-        with len_with_cjk_width_factor(cjk_width_factor):
-            return self._format_text(
-                "msgid", self.msgid, width, reformat=not no_msgid
-            ) + self._format_text("msgstr", self.msgstr, width)
+        wrapper = CJKTextWrapper(width - 2, cjk_width_factor, drop_whitespace=False)
+        return self._format_text(
+            "msgid", self.msgid, width, wrapper, reformat=not no_msgid
+        ) + self._format_text("msgstr", self.msgstr, width, wrapper)
 
 
 class Source:
     def __init__(self, filename: str, lines: t.Optional[t.Sequence[str]] = None) -> None:
         self.filename = filename
         if lines is None:
-            lines = list(Path(filename).read_text("utf-8").splitlines())
+            with open(filename, "rb") as f:
+                lines = f.read().decode("utf-8").splitlines()
         self.lines = lines
-        self._original = self.lines[:]
-        self.lineno = -1
-        self._entries: t.List[Entry] = []
-
-    def __iter__(self) -> t.Iterator[str]:
-        return self
-
-    def __next__(self) -> str:
-        self.lineno += 1
-        if self.lineno >= len(self.lines):
-            raise StopIteration()
-        return self.lines[self.lineno]
-
-    def parse_error(self, message: str, lineno: t.Optional[int] = None) -> str:
-        if lineno is None:
-            lineno = self.lineno
+        self._original = tuple(self.lines)
+        # Untouched line blocks interleaved with the entries to format, in source order
+        self._chunks: t.List[t.Union[t.Sequence[str], Entry]] = []
+
+    def parse_error(self, message: str, lineno: int) -> t.NoReturn:
         raise ParseError(f"line {lineno}: {message}")
 
     def parse(self) -> None:
-        if self.lineno >= 0:
+        if self._chunks:
             raise RuntimeError("Can't parse multiple times on one source")
-        for line in self:
+        lines = self.lines
+        cursor = 0
+        i, count = 0, len(lines)
+        while i < count:
+            line = lines[i]
             if line.startswith("#, ") and line[3:].strip() == "fuzzy":
                 # Don't modify the fuzzy entries
-                self._parse_entry()
-            if not line.strip() or line.startswith("#"):
-                continue
+                _, i = self._parse_entry(i + 1)
+            elif not line.strip() or line.startswith("#"):
+                i += 1
             elif line.startswith("msgid"):
-                self.lineno -= 1
-                self._entries.append(self._parse_entry())
+                entry, i = self._parse_entry(i)
+                self._chunks.append(lines[cursor : entry.span.start])
+                self._chunks.append(entry)
+                cursor = entry.span.end
             else:
-                self.parse_error("Unexpected token")
+                self.parse_error("Unexpected token", i)
+        self._chunks.append(lines[cursor:])
 
-    def _parse_entry(self) -> Entry:
+    def _parse_entry(self, start: int) -> t.Tuple[Entry, int]:
+        """Parse an entry from the given line index, return the entry
+        and the index of the first line after it.
+        """
         msgid, msgstr = [], []
         temp = []
-        start_line = self.lineno
+        start_line = start
+        lines = self.lines
 
-        for line in self:
+        for i in range(start, len(lines)):
+            line = lines[i]
             if not line.strip():
                 break
-            if line.startswith("#"):
+            match = _ENTRY_LINE_RE.match(line)
+            if match is not None:
+                kind = match.lastgroup
+            elif line.startswith("msgid"):
+                kind = "msgid"
+            elif line.startswith("msgstr"):
+                kind = "msgstr"
+            else:
+                kind = "message"
+            if kind == "comment":
                 continue
-            if line.startswith("msgid"):
+            if kind == "msgid":
                 if msgid:
-                    self.lineno -= 1
                     break
-                match = re.match(MESSAGE_RE, line[6:])
-                if not match:
-                    self.parse_error('Expect `msgid "..."`')
-                msgid.append(match.group(1))
-                start_line = self.lineno
+                if match is None:
+                    self.parse_error('Expect `msgid "..."`', i)
+                msgid.append(match.group(kind))
+                start_line = i
                 temp = msgid
-            elif line.startswith("msgstr"):
+            elif kind == "msgstr":
                 if msgstr:
-                    self.lineno -= 1
                     break
-                match = re.match(MESSAGE_RE, line[7:])
-                if not match:
-                    self.parse_error('Expect `msgstr: "..."`')
-                msgstr.append(match.group(1))
+                if match is None:
+                    self.parse_error('Expect `msgstr: "..."`', i)
+                msgstr.append(match.group(kind))
                 temp = msgstr
             else:
-                match = re.match(MESSAGE_RE, line)
-                if not match:
-                    self.parse_error('Expect `"..."`')
-                temp.append(match.group(1))
+                if match is None:
+                    self.parse_error('Expect `"..."`', i)
+                temp.append(match.group(kind))
+        else:
+            i = len(lines)
 
         if not msgstr:
-            self.parse_error("Missing msgstr")
-        return Entry(Span(start_line, self.lineno), msgid, msgstr)
+            # Stopped at the start of the next entry, point at the last line of this one
+            lineno = i - 1 if i < len(lines) and lines[i].strip() else i
+            self.parse_error("Missing msgstr", lineno)
+        return Entry(Span(start_line, i), msgid, msgstr), i
 
     def fix(
         self,
@@ -204,30 +330,76 @@ class Source:
         show: bool = False,
     ) -> bool:
         self.parse()
-        for entry in reversed(self._entries):
-            self.lines[entry.span.start : entry.span.end] = entry.format(
-                line_length, cjk_width, no_msgid
-            )
+        lines: t.List[str] = []
+        for chunk in self._chunks:
+            if isinstance(chunk, Entry):
+                lines.extend(chunk.format(line_length, cjk_width, no_msgid))
+            else:
+                lines.extend(chunk)
+        self.lines = lines
         return self.diff(show)
 
     def diff(self, show: bool = False) -> bool:
-        has_diff = False
-        show_title = False
-        for line in difflib.unified_diff(
-            self._original, self.lines, "Original", "Current", lineterm=""
-        ):
-            if show:
-                if not show_title:
-                    print(f"Need update: {self.filename}")
-                    show_title = True
+        if tuple(self.lines) == self._original:
+            return False
+        if show:
+            print(f"Need update: {self.filename}")
+            for line in difflib.unified_diff(
+                self._original, self.lines, "Original", "Current", lineterm=""
+            ):
                 print(line)
-            has_diff = True
-        return has_diff
+        return True
 
     def write(self, path: t.Union[str, Path]) -> None:
         Path(path).write_text("\n".join(self.lines) + "\n", encoding="utf-8")
 
 
+def iter_po_files(root: str) -> t.Iterator[str]:
+    """Yield all po files under the directory recursively, hidden files and
+    directories are skipped like what `glob` does.
+    """
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_po_files(entry.path)
+            elif entry.name.endswith(".po"):
+                yield entry.path
+
+
+class _FileResult(t.NamedTuple):
+    path: str
+    changed: bool
+    error: t.Optional[str]
+    output: str
+
+
+def _process_file(
+    path: str, line_length: int, cjk_width: float, no_msgid: bool, check: bool
+) -> _FileResult:
+    """Format one file, the diff output is captured and returned to the caller
+    instead of being printed, so it can run in a worker process as well.
+    """
+    source = Source(path)
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            changed = source.fix(line_length, cjk_width=cjk_width, no_msgid=no_msgid, show=check)
+    except ParseError as e:
+        return _FileResult(path, False, str(e), output.getvalue())
+    if changed and not check:
+        source.write(path)
+    return _FileResult(path, changed, None, output.getvalue())
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value!r}")
+    return number
+
+
 def cli(argv: t.Optional[t.Sequence[str]] = None) -> int:
     parser = argparse.ArgumentParser(description="Format PO files for consistency")
     parser.add_argument(
@@ -241,6 +413,13 @@ def cli(argv: t.Optional[t.Sequence[str]] = None) -> int:
         help="The width factor of a CJK character, default: 1.8",
     )
     parser.add_argument("--no-msgid", action="store_true", help="Don't format msgid")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=None,
+        help="The number of processes to format files in parallel, default to the CPU count",
+    )
     parser.add_argument(
         "filename",
         nargs="*",
@@ -256,28 +435,37 @@ def cli(argv: t.Optional[t.Sequence[str]] = None) -> int:
     else:
         ERROR, SUCCESS = ":(", ":)"
 
+    paths: t.List[str] = []
     for filename in args.filename:
         if os.path.isdir(filename):
-            filename = os.path.join(filename, "**/*.po")
-        for path in glob.glob(filename, recursive=True):
-            source = Source(path)
-            try:
-                if source.fix(
-                    args.line_length,
-                    cjk_width=args.cjk_width,
-                    no_msgid=args.no_msgid,
-                    show=args.check,
-                ):
-                    if not args.check:
-                        source.write(path)
-                        print(f"{SUCCESS} {path} is updated")
-                    changed += 1
-                else:
-                    identical += 1
-            except ParseError as e:
+            paths.extend(iter_po_files(filename))
+        else:
+            paths.extend(glob.glob(filename, recursive=True))
+
+    process = functools.partial(
+        _process_file,
+        line_length=args.line_length,
+        cjk_width=args.cjk_width,
+        no_msgid=args.no_msgid,
+        check=args.check,
+    )
+    with contextlib.ExitStack() as stack:
+        if args.jobs == 1 or len(paths) <= 1:
+            results: t.Iterable[_FileResult] = map(process, paths)
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(args.jobs))
+            results = executor.map(process, paths)
+        for result in results:
+            print(result.output, end="")
+            if result.error is not None:
                 errors += 1
-                print(f"{ERROR} {path} Parse error: {e}")
-                continue
+                print(f"{ERROR} {result.path} Parse error: {result.error}")
+            elif result.changed:
+                if not args.check:
+                    print(f"{SUCCESS} {result.path} is updated")
+                changed += 1
+            else:
+                identical += 1
 
     print(
         f"\nChecked {identical + changed + errors} file(s), "
@@ -1,19 +1,22 @@
 import shutil
 from pathlib import Path
 
+import pytest
+
 from pofmt.core import cli
 
 FIXTURES = Path(__file__).parent / "fixtures"
 
 
-def test_find_po_files(tmp_path, capfd):
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_find_po_files(tmp_path, capfd, jobs):
     golden = FIXTURES / "golden.po"
     dest_paths = [tmp_path / "a.po", tmp_path / "deep/inner/path/b.po"]
     for path in dest_paths:
         path.parent.mkdir(parents=True, exist_ok=True)
         shutil.copyfile(FIXTURES / "raw.po", path)
 
-    result = cli([str(tmp_path)])
+    result = cli(["--jobs", jobs, str(tmp_path)])
     assert result != 0
     out, _ = capfd.readouterr()
     assert "Checked 2 file(s)" in out
@@ -56,3 +59,37 @@ def test_check_without_update(tmp_path, capfd):
 
     for path in dest_paths:
         assert path.read_text("utf-8") == raw.read_text("utf-8")
+
+
+def test_skip_hidden_directories(tmp_path, capfd):
+    raw = FIXTURES / "raw.po"
+    hidden = tmp_path / ".venv/lib/c.po"
+    hidden.parent.mkdir(parents=True)
+    shutil.copyfile(raw, hidden)
+    shutil.copyfile(FIXTURES / "golden.po", tmp_path / "a.po")
+
+    result = cli([str(tmp_path)])
+    assert result == 0
+    out, _ = capfd.readouterr()
+    assert "Checked 1 file(s)" in out
+    assert hidden.read_text("utf-8") == raw.read_text("utf-8")
+
+
+@pytest.mark.parametrize("jobs", ["0", "-1", "x"])
+def test_invalid_jobs(jobs, capfd):
+    with pytest.raises(SystemExit):
+        cli(["--jobs", jobs])
+    _, err = capfd.readouterr()
+    assert "--jobs" in err
+
+
+def test_unchanged_file_not_written(tmp_path, capfd):
+    path = tmp_path / "a.po"
+    shutil.copyfile(FIXTURES / "golden.po", path)
+    mtime = path.stat().st_mtime_ns
+
+    result = cli([str(path)])
+    assert result == 0
+    out, _ = capfd.readouterr()
+    assert "0 file(s) changed" in out
+    assert path.stat().st_mtime_ns == mtime
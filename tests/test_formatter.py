@@ -3,7 +3,7 @@ from pathlib import Path
 
 import pytest
 
-from pofmt.core import ParseError, Source
+from pofmt.core import CJKTextWrapper, ParseError, Source, count_full_width, is_full_width
 
 FIXTURES = Path(__file__).parent / "fixtures"
 
@@ -37,6 +37,43 @@ def test_format_file_no_msgid():
     assert content == golden.read_text(encoding="utf-8")
 
 
+def test_measure_cjk_width_rounding():
+    # The widths are summed one by one, a multiply-add would give 59 here
+    text = "好ab你 好 b，a。   b。你你你。好你，。好，好a好。好 你，，，b 你"  # noqa: RUF001
+    assert CJKTextWrapper(76, 1.8).measure(text) == 58
+
+
+@pytest.mark.parametrize("factor", [1.3, 1.8, 3.0])
+@pytest.mark.parametrize(
+    "text", ["hello", "你好 world 世界", "你\x01好", "a\U00020000中文", "\U000f0000 好"]
+)
+def test_measure_cjk_width(text, factor):
+    expected = int(sum(factor if is_full_width(c) else 1 for c in text))
+    assert CJKTextWrapper(76, factor).measure(text) == expected
+
+
+def test_cjk_wrapper_rejects_max_lines():
+    with pytest.raises(ValueError):
+        CJKTextWrapper(76, max_lines=2)
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("", 0),
+        ("hello", 0),
+        ("你好世界", 4),
+        ("a\x01b", 0),
+        ("你\x01好", 2),
+        ("\U00020000", 1),
+        ("\U0001f600x", 1),
+        ("a\U00020000中\U00010000", 2),
+    ],
+)
+def test_count_full_width(text, expected):
+    assert count_full_width(text) == expected
+
+
 def test_format_fuzzy_translation_with_previous_msgid():
     lines = [
         "#: path/to/file.html:136",
@@ -49,29 +86,53 @@ def test_format_fuzzy_translation_with_previous_msgid():
     assert not s.fix(76)
 
 
+def test_format_entries_without_blank_line():
+    lines = [
+        'msgid "Hello"',
+        'msgstr "你好"',
+        'msgid "World"',
+        'msgstr "世界"',
+    ]
+    s = Source("test_file", lines)
+    assert not s.fix(76)
+    assert s.lines == lines
+
+
 @pytest.mark.parametrize(
-    "error_text",
+    "error_text,message",
     [
-        textwrap.dedent(
-            """msgid
+        (
+            textwrap.dedent(
+                """msgid
     msgstr "hello"
     """
+            ),
+            None,
         ),
-        textwrap.dedent(
-            """msgid "hello
+        (
+            textwrap.dedent(
+                """msgid "hello
     msgstr "world"
     """
+            ),
+            None,
         ),
-        'msgstr "hello world"',
-        textwrap.dedent(
-            """msgid ""
+        ('msgstr "hello world"', None),
+        (
+            textwrap.dedent(
+                """msgid ""
         hello world"
         msgstr "foobar"
         """
+            ),
+            None,
         ),
+        ('msgid "a b"\nmsgid ""', "line 0: Missing msgstr"),
+        ('msgid "a"\n"b"\n\nmsgid ""', "line 2: Missing msgstr"),
+        ('msgid "a"', "line 1: Missing msgstr"),
     ],
 )
-def test_parse_error(error_text):
+def test_parse_error(error_text, message):
     s = Source("test_file", error_text.splitlines())
-    with pytest.raises(ParseError):
+    with pytest.raises(ParseError, match=message):
         s.parse()